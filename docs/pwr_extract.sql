@@ -24,7 +24,7 @@ SELECT
 			ELSE RIGHT(LEFT(wte.[fyear], 4), 2)
 		END
 	) AS [period_datapoint],
-	--wte.[org_code],
+	wte.[org_code],
 	--wte.[org_name],
 	wte.[contract],
 	wte.[shorthand],
@@ -0,0 +1,178 @@
+'''
+Dimension tables and the aggregation kernel shared by the pipelines.
+
+Each dimension (org, staff role, band, contract, period) is a list of labels
+where the position of a label is its integer code. Data is aggregated by
+encoding the key columns and summing the values with np.bincount over the
+combined codes, which keeps the output order stable between runs.
+'''
+import numpy as np
+import pandas as pd
+
+from utils.time_axis import MONTH_NAMES
+
+#AfC bands in display order (bands not listed are added after these)
+AFC_BANDS = ["1", "2", "3", "4", "5", "6", "7",
+             "8a", "8b", "8c", "8d", "9", "Non-AfC"]
+
+#PWR contract types in display order
+CONTRACTS = ["Substantive", "Bank", "Agency"]
+
+#Build the dimension tables from the config and staff role lookup
+def load_dimensions(settings):
+
+    #Load the AHP staff role map
+    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
+
+    return {
+        "org_code": list(settings["org_codes"]),
+        "org_shorthand": sorted(settings["org_shorts"]),
+        "staff_role": sorted(df_flu["staff_role_frontend"].unique().tolist()),
+        "staff_role_shorthand": sorted(
+            df_flu["role_shorthand"].unique().tolist()),
+        "afc_band": list(AFC_BANDS),
+        "contract": list(CONTRACTS),
+        #Lookup rows (fuzzy, staff_role_frontend, role_shorthand) for the
+        #staff role mapping and the role key on the charts
+        "role_lookup": df_flu
+    }
+
+#Add the period dimension from a calendar (see fin_month_calendar and
+#date_calendar) once the range of the data is known
+def add_period_dimension(dimensions, calendar):
+    return {
+        **dimensions,
+        "period_key": calendar["period_key"].tolist(),
+        "period_calendar": calendar
+    }
+
+#Key of each financial year and month (i.e. 2022-23_05)
+def fin_month_key(fin_years, fin_months):
+    return [f"{fy}_{int(month):02d}" for fy, month in zip(fin_years, fin_months)]
+
+#Complete monthly calendar between the first and last financial year/month in
+#the data (months with no data are included so the calendar has no gaps)
+def fin_month_calendar(fin_years, fin_months):
+
+    fin_years = pd.Series(fin_years).astype(str).reset_index(drop=True)
+    fin_months = pd.Series(fin_months).astype(int).reset_index(drop=True)
+
+    #Months since April of year 0
+    month_index = fin_years.str[:4].astype(int) * 12 + fin_months - 1
+    month_index = np.arange(month_index.min(), month_index.max() + 1)
+    start_years = month_index // 12
+    months = month_index % 12 + 1
+
+    #Financial years in the same format as the data (i.e. 2022-23)
+    sample = fin_years.iloc[0]
+    if len(sample) > 5:
+        sep, tail = sample[4], len(sample) - 5
+        fy_names = [f"{year}{sep}{str(year + 1)[-tail:]}"
+                    for year in start_years]
+    else:
+        fy_names = [str(year) for year in start_years]
+
+    #Calendar year and month of each financial month (April is month 1)
+    years = start_years + (months >= 10)
+    cal_months = (months + 2) % 12 + 1
+
+    return pd.DataFrame({
+        "fin_year": fy_names,
+        "fin_month": months,
+        "period_key": fin_month_key(fy_names, months),
+        "period_datapoint": [f"{MONTH_NAMES[month]}-{year % 100:02d}"
+                             for month, year in zip(months, years)],
+        "period_date": pd.to_datetime(
+            pd.DataFrame({"year": years, "month": cal_months, "day": 1}))
+    })
+
+#Key of each period date (i.e. 2024-06-30)
+def date_key(dates):
+    return pd.to_datetime(pd.Series(dates)).dt.strftime("%Y-%m-%d").tolist()
+
+#Calendar of the distinct period dates in the data (i.e. annual NWFS files)
+def date_calendar(dates):
+
+    dates = pd.Series(pd.to_datetime(pd.Series(dates).unique())).sort_values()
+
+    return pd.DataFrame({
+        "period_key": date_key(dates),
+        "period_datapoint": dates.dt.strftime("%b-%y"),
+        "period_date": dates
+    }).reset_index(drop=True)
+
+#Index of the period in the same month a year before each period
+#(-1 where that month is not in the calendar)
+def year_ago_index(period_dates):
+
+    dates = pd.DatetimeIndex(period_dates)
+    year_months = dates.year * 12 + dates.month
+
+    return encode(year_months - 12, year_months)
+
+#Get the labels for a column, using the dimension table if there is one
+#Values in the data missing from the dimension table are appended (sorted)
+def dimension_labels(df, col, dimensions=None, extend=False):
+
+    if dimensions is not None and col in dimensions:
+        labels = list(dimensions[col])
+        if not extend:
+            return labels
+    else:
+        labels = []
+
+    unseen = set(df[col].dropna().unique().tolist()) - set(labels)
+
+    return labels + sorted(unseen)
+
+#Convert values into integer codes (-1 for values not in the labels)
+def encode(values, labels):
+    return pd.Index(labels).get_indexer(values)
+
+#Sum the weights for each combination of codes using np.bincount
+#Rows with a code of -1 in any dimension are excluded
+def bincount_sum(codes, shape, weights):
+
+    codes = np.vstack(codes)
+    mask = np.all(codes >= 0, axis=0)
+    flat_codes = np.ravel_multi_index(codes[:, mask], shape)
+    size = int(np.prod(shape))
+
+    sums = {}
+    for name, values in weights.items():
+        values = np.nan_to_num(
+            np.asarray(values, dtype=float)[mask], nan=0.0)
+        sums[name] = np.bincount(
+            flat_codes, weights=values, minlength=size).reshape(shape)
+
+    #Number of rows in each cell (used to drop empty cells)
+    counts = np.bincount(flat_codes, minlength=size).reshape(shape)
+
+    return sums, counts
+
+#Aggregate a data frame by the key columns (the equivalent of a groupby sum)
+#Keys are ordered by their dimension table followed by any other values
+#If dense is set every combination of labels is returned (empty cells are 0)
+#otherwise only combinations that appear in the data are returned
+def group_sum(df, keys, values, dimensions=None, dense=False):
+
+    labels = [dimension_labels(df, key, dimensions, extend=True)
+              for key in keys]
+    shape = tuple(len(key_labels) for key_labels in labels)
+
+    sums, counts = bincount_sum(
+        [encode(df[key], key_labels) for key, key_labels in zip(keys, labels)],
+        shape,
+        {value: df[value].to_numpy() for value in values})
+
+    #Label columns for the output cells (decoded from the flat cell index)
+    cells = np.arange(counts.size) if dense else np.flatnonzero(counts)
+    cell_codes = np.unravel_index(cells, shape)
+
+    df_res = pd.DataFrame(
+        {key: np.asarray(key_labels, dtype=object)[key_codes]
+         for key, key_labels, key_codes in zip(keys, labels, cell_codes)})
+    for value in values:
+        df_res[value] = sums[value].ravel()[cells]
+
+    return df_res.infer_objects()
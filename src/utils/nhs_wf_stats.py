@@ -3,6 +3,7 @@ Pipeline for outputs sourced from the NHS Workforce Statistics source data
 Source: https://digital.nhs.uk/data-and-information/publications/statistical/nhs-workforce-statistics/
 '''
 import os
+import re
 import pandas as pd
 from datetime import datetime as dt
 
@@ -10,6 +11,14 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import seaborn as sns
 
+from utils.dimensions import (
+    load_dimensions, add_period_dimension, dimension_labels, group_sum,
+    date_calendar, date_key)
+from utils.trend_analytics import *
+from utils.snapshots import snapshot_run
+from utils.targets import (
+    pipeline_targets, requires_latest_only, requires_trends)
+
 #Find all unique column values for a specified column that contains the target
 #I am fully aware this is not what fuzzy matching is
 def fuzzy_search(df_nwfs, col_name, target_string):
@@ -22,8 +31,8 @@ def fuzzy_search(df_nwfs, col_name, target_string):
 #Function to map src data staff roles to consistent front end names
 def nwfs_staff_role_fuzzy_mapping(df_nwfs, settings):
 
-    #Load the AHP staff role map
-    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
+    #AHP staff role map (see load_dimensions)
+    df_flu = settings["dimensions"]["role_lookup"]
 
     #Build the map of existing row names to front end names
     sr_map = {}
@@ -56,32 +65,34 @@ def format_afc_col(val):
     else:
         return val.split(" ")[1]
 
-#Zero fill for column values that do not appear in the data
-def zero_fill(df, column_name, column_values):
-
-    #Create copy of the input data frame
-    df_zfed = df.copy()
-    num_of_cols = df_zfed.shape[1]
-    dummy_row = []
-    for i in range(num_of_cols):
-        dummy_row.append(None)
-
-    #Get list of values that do appear in the data
-    values_in_data = df[column_name].unique()
+#Get the period of a source file
+#i.e. "NHS Workforce Statistics, June 2024 staff excluding medical.csv"
+def nwfs_file_period(data_path, data_file):
 
-    #Add dummy rows for the missing data
-    for value in column_values:
-        if value not in values_in_data:
-            df_zfed.loc[df_zfed.shape[0]] = dummy_row
-            df_zfed.loc[df_zfed.shape[0]-1][column_name] = 0
+    #Use the period in the file name where possible
+    match = re.search(r"([A-Z][a-z]+ \d{4})", data_file)
+    if match:
+        try:
+            return dt.strptime(match.group(1), "%B %Y")
+        except ValueError:
+            pass
 
-    return df_zfed
+    #Otherwise read the Date column from the file
+    return pd.to_datetime(pd.read_csv(
+        os.path.join(data_path, data_file), usecols=["Date"])["Date"]).max()
 
 #Load the source data from the nwfs source files
-def load_nwfs_data(settings):
+#If latest_only is set only the file with the latest period is loaded
+def load_nwfs_data(settings, latest_only=False):
 
     #Load source data###########################################################
     data_files = os.listdir(settings["nwfs_path"])
+
+    if latest_only:
+        data_files = [max(
+            data_files,
+            key=lambda data_file: nwfs_file_period(
+                settings["nwfs_path"], data_file))]
     
     df_src = pd.concat(
         [pd.read_csv(
@@ -131,19 +142,15 @@ def load_nwfs_data(settings):
 
     #Add the Org Shorthand column
     df_src["org_shorthand"] = df_src["org_code"].map(
-        dict(
-            map(
-                lambda i,j : (i,j) , 
-                settings["org_codes"], 
-                settings["org_shorts"]
-            )
-        )
-    )
+        dict(zip(settings["org_codes"], settings["org_shorts"])))
 
     #Add formatted period column
     df_src["period_datapoint"] = pd.to_datetime(
         df_src["period"]).dt.strftime('%b-%y')
 
+    #Periods are keyed on the source date (one period per source file)
+    df_src["period_key"] = date_key(df_src["period"])
+
     return df_src
 
 #Plot AHP Role against Band
@@ -153,24 +160,24 @@ def plot_role_by_band(df, settings):
     df = df[df["period"] == df["period"].max()]
 
     #Load list of AHP roles
-    ahp_roles = pd.read_csv(
-        "docs/nwfs_lookup.csv")["staff_role_frontend"].unique()
-    ahp_roles.sort()
+    dimensions = settings["dimensions"]
+    ahp_roles = dimensions["staff_role"]
 
     # Initialize the figure and axes for a 4x3 grid
     fig, axes = plt.subplots(3, 4, figsize=(16, 9))
     axes = axes.flatten()
 
     # Get all bands from the data
-    afc_bands = df["afc_band"].unique()
-    afc_bands.sort()
+    afc_bands = [band for band in dimension_labels(
+                    df, "afc_band", dimensions, extend=True)
+                 if band in df["afc_band"].unique()]
+
+    #Aggregate data
+    df_agg = group_sum(df, ["staff_role", "afc_band"], ["wte"], dimensions)
 
     # Loop over each axis and plot the barplots
     for i, ax in enumerate(axes):
-        df_role = df.copy()[df["staff_role"] == ahp_roles[i]]
-
-        #Aggregate data
-        df_role = df_role.groupby('afc_band', as_index=False)['wte'].sum()
+        df_role = df_agg[df_agg["staff_role"] == ahp_roles[i]]
 
         sns.barplot(
             x="afc_band", 
@@ -209,24 +216,23 @@ def plot_role_by_org (df, settings):
     df = df[df["period"] == df["period"].max()]
 
     #Load list of AHP roles
-    ahp_roles = pd.read_csv(
-        "docs/nwfs_lookup.csv")["staff_role_frontend"].unique()
-    ahp_roles.sort()
+    dimensions = settings["dimensions"]
+    ahp_roles = dimensions["staff_role"]
 
     # Initialize the figure and axes for a 4x3 grid
     fig, axes = plt.subplots(3, 4, figsize=(16, 9))
     axes = axes.flatten()
 
     #Load list of orgs
-    org_shorts = settings["org_shorts"]
-    org_shorts.sort()
+    org_shorts = dimensions["org_shorthand"]
+
+    #Aggregate data
+    df_agg = group_sum(
+        df, ["staff_role", "org_shorthand"], ["wte"], dimensions)
 
     # Loop over each axis and plot the barplots
     for i, ax in enumerate(axes):
-        df_role = df.copy()[df["staff_role"] == ahp_roles[i]]
-
-        #Aggregate data
-        df_role = df_role.groupby('org_shorthand', as_index=False)['wte'].sum()
+        df_role = df_agg[df_agg["staff_role"] == ahp_roles[i]]
 
         sns.barplot(
             x="org_shorthand", 
@@ -265,26 +271,26 @@ def plot_org_by_role (df, settings):
     df = df[df["period"] == df["period"].max()]
 
     #Load list of AHP roles (shorthand)
-    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
-    ahp_roles = df_flu["role_shorthand"].unique()
-    ahp_roles.sort()
+    dimensions = settings["dimensions"]
+    df_flu = dimensions["role_lookup"]
+    ahp_roles = dimensions["staff_role_shorthand"]
 
     # Initialize the figure and axes for a 4x3 grid
     fig, axes = plt.subplots(3, 4, figsize=(18, 9))
     axes = axes.flatten()
 
     #Load list of orgs
-    org_shorts = settings["org_shorts"]
+    org_shorts = dimensions["org_shorthand"]
+
+    #Aggregate data
+    df_agg = group_sum(
+        df, ["org_shorthand", "staff_role_shorthand"], ["wte"], dimensions)
 
     # Loop over each axis and plot the barplots
     for i, ax in enumerate(axes):
 
-        if i < 10:
-            df_org = df.copy()[df["org_shorthand"] == org_shorts[i]]
-
-            #Aggregate data
-            df_org = df_org.groupby(
-                'staff_role_shorthand', as_index=False)['wte'].sum()
+        if i < len(org_shorts):
+            df_org = df_agg[df_agg["org_shorthand"] == org_shorts[i]]
 
             sns.barplot(
                 x="staff_role_shorthand", 
@@ -310,8 +316,7 @@ def plot_org_by_role (df, settings):
 
     # Add NCL overall as a plot (fig 10)
     #Aggregate data
-    df_ncl = df.copy().groupby(
-        'staff_role_shorthand', as_index=False)['wte'].sum()
+    df_ncl = group_sum(df, ["staff_role_shorthand"], ["wte"], dimensions)
 
     sns.barplot(
         x="staff_role_shorthand", 
@@ -365,14 +370,11 @@ def plot_org_by_role (df, settings):
                 dpi=300, bbox_inches='tight')#, transparent=True)
 
 #Plot year on year growth
-def plot_yoy_by_org (df, settings):
+#df_trend is the period x org slice of the trend metrics
+def plot_yoy_by_org (df_trend, settings):
 
     #Load list of orgs
-    org_shorts = settings["org_shorts"]
-    org_shorts.sort()
-
-    #Aggregate data
-    df_trend = df.groupby(['period_datapoint', 'org_shorthand'], as_index=False)['wte'].sum()
+    org_shorts = settings["dimensions"]["org_shorthand"]
 
     fig, ax = plt.subplots(figsize=(6, 4))
 
@@ -410,21 +412,13 @@ def plot_yoy_by_org (df, settings):
                 dpi=300, bbox_inches='tight')
 
 #Plot year on year growth
-def plot_yoy_by_role (df, settings):
-
-    #Sort the data by the x axis column
-    df.sort_values(by='staff_role_shorthand', inplace=True)
+#df_trend is the period x staff role slice of the trend metrics
+def plot_yoy_by_role (df_trend, settings):
 
     #Load list of AHP roles (shorthand)
-    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
-    ahp_roles = df_flu["role_shorthand"].unique()
-    ahp_roles.sort()
+    df_flu = settings["dimensions"]["role_lookup"]
+    ahp_roles = settings["dimensions"]["staff_role_shorthand"]
 
-    #Aggregate data
-    df_trend = df.groupby(
-        ['period_datapoint', 'staff_role_shorthand'], as_index=False
-        )['wte'].sum()
-    
     periods = len(df_trend["period_datapoint"].unique())
 
     fig, axes = plt.subplots(
@@ -438,7 +432,7 @@ def plot_yoy_by_role (df, settings):
         x="staff_role_shorthand", 
         y="wte",
         hue="period_datapoint",
-        data=zero_fill(df_trend, "staff_role_shorthand", ahp_roles),
+        data=df_trend,
         order=ahp_roles,
         ax=axes[0],
         palette=ncl_palette
@@ -476,23 +470,69 @@ def plot_yoy_by_role (df, settings):
     plt.savefig('./output/trends/by_role.png', 
                 dpi=300, bbox_inches='tight')
 
+#Build the trend cube and metrics (period x org x staff role x band)
+def build_nwfs_trends(df, settings):
+
+    cube = build_cube(
+        df,
+        dims=["org_shorthand", "staff_role_shorthand", "afc_band"],
+        values=["wte"],
+        dimensions=settings["dimensions"],
+        extend=["afc_band"]
+    )
+    cube = add_totals(cube)
+
+    metrics = trend_metrics(cube, "wte")
+
+    return cube, metrics_to_frame(cube, metrics)
+
 #Main function for the pipeline
 def nhs_wf_stats(settings):
 
-    #Load the data
-    df_nwfs = load_nwfs_data(settings=settings)
+    #Targets to build for this run
+    targets = pipeline_targets(settings, "pipeline_nwfs")
+
+    #Dimension tables (orgs, staff roles, bands) used by the outputs
+    settings = {**settings, "dimensions": load_dimensions(settings)}
+
+    #Load the data (only the latest file if no trend outputs are needed)
+    latest_only = requires_latest_only(targets)
+    df_nwfs = load_nwfs_data(settings=settings, latest_only=latest_only)
 
-    df_nwfs.to_csv("ncldata.csv", index=False)
+    #Calendar of the source file dates
+    settings["dimensions"] = add_period_dimension(
+        settings["dimensions"], date_calendar(df_nwfs["period"]))
+
+    if not latest_only:
+        df_nwfs.to_csv("ncldata.csv", index=False)
 
     #Plot AHP Staff Role by Band
-    plot_role_by_band(df_nwfs, settings=settings)
+    if "wte_by_afcband" in targets:
+        plot_role_by_band(df_nwfs, settings=settings)
 
     #Plot AHP Staff Role by Organisation
-    plot_role_by_org(df_nwfs, settings)
+    if "wte_by_org" in targets:
+        plot_role_by_org(df_nwfs, settings)
 
     #Plot Org AHP WTE by Staff Role
-    plot_org_by_role(df_nwfs, settings)
+    if "wte_by_role" in targets:
+        plot_org_by_role(df_nwfs, settings)
+
+    if not requires_trends(targets):
+        return
+
+    #Calculate the trend metrics
+    cube, df_trends = build_nwfs_trends(df_nwfs, settings)
+    if "trends/nwfs_trend_metrics" in targets:
+        df_trends.to_csv("./output/trends/nwfs_trend_metrics.csv", index=False)
+
+    #Save the aggregated results and report the change since the last run
+    snapshot_run("nwfs", cube)
 
     #Plot annual data
-    plot_yoy_by_org(df_nwfs, settings)
-    plot_yoy_by_role(df_nwfs, settings)
\ No newline at end of file
+    if "trends/by_org" in targets:
+        plot_yoy_by_org(
+            select_slice(df_trends, cube, ["org_shorthand"]), settings)
+    if "trends/by_role" in targets:
+        plot_yoy_by_role(
+            select_slice(df_trends, cube, ["staff_role_shorthand"]), settings)
\ No newline at end of file
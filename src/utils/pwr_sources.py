@@ -0,0 +1,158 @@
+'''
+Data source backends for the PWR pipeline.
+
+The "sqlserver" backend runs docs/pwr_extract.sql against the Sandpit. The
+"sqlite" backend runs docs/pwr_extract_portable.sql against a local SQLite
+database holding copies of the wf_pwr_wte_vw and wf_pwr_kpi_vw views, so the
+pipeline can be run and profiled without a Sandpit connection. The local
+database can be filled from the Sandpit (cache_pwr_views) or with generated
+data for load testing (generate_pwr_tables).
+'''
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+#Names of the PWR views (used as the table names in the local database)
+PWR_WTE_TABLE = "wf_pwr_wte_vw"
+PWR_KPI_TABLE = "wf_pwr_kpi_vw"
+
+#Schema of the PWR views in the Sandpit
+PWR_SCHEMA = "JakeK"
+
+#Load a sql script
+def read_sql_file(sql_path):
+    with open(sql_path, "r") as f:
+        return f.read()
+
+#Execute the PWR extract against the Sandpit
+def load_pwr_sqlserver(settings):
+    import ncl_sqlsnippets as snips
+
+    sql_query = read_sql_file("./docs/pwr_extract.sql")
+
+    engine = snips.connect(settings["sql_address"], settings["pwr_database"])
+    return snips.execute_sfw(engine, sql_query)
+
+#Execute the portable PWR extract against the local database
+def load_pwr_sqlite(settings):
+
+    sql_query = read_sql_file("./docs/pwr_extract_portable.sql")
+
+    with closing(sqlite3.connect(settings["pwr_local_db"])) as conn:
+        return pd.read_sql_query(sql_query, conn)
+
+#Available PWR data source backends
+PWR_BACKENDS = {
+    "sqlserver": load_pwr_sqlserver,
+    "sqlite": load_pwr_sqlite
+}
+
+#Load the PWR extract using the backend set in the settings
+def load_pwr_source(settings):
+
+    backend = settings["pwr_source"]
+    if backend not in PWR_BACKENDS:
+        raise ValueError(
+            f"Unknown PWR source: {backend}. " +
+            f"Valid sources are: {', '.join(PWR_BACKENDS)}")
+
+    time_start = time.perf_counter()
+    df_res = PWR_BACKENDS[backend](settings)
+    time_taken = time.perf_counter() - time_start
+
+    print(f"Loaded {df_res.shape[0]} PWR rows from {backend} " +
+          f"in {time_taken:.2f}s.")
+
+    return df_res
+
+#Write the PWR view tables to a local SQLite database (replacing them)
+def write_local_pwr_db(db_path, df_wte, df_kpi):
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        df_wte.to_sql(PWR_WTE_TABLE, conn, if_exists="replace", index=False)
+        df_kpi.to_sql(PWR_KPI_TABLE, conn, if_exists="replace", index=False)
+
+        #Index the join columns used by the extract
+        for table in [PWR_WTE_TABLE, PWR_KPI_TABLE]:
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{table} ON {table} " +
+                "(fyear, month, org_code, subprofession)")
+        conn.commit()
+
+#Copy the PWR views from the Sandpit into the local database
+def cache_pwr_views(settings):
+    import ncl_sqlsnippets as snips
+
+    engine = snips.connect(settings["sql_address"], settings["pwr_database"])
+
+    df_views = [
+        snips.execute_sfw(
+            engine,
+            f"SELECT * FROM [{settings['pwr_database']}].[{PWR_SCHEMA}].[{table}]")
+        for table in [PWR_WTE_TABLE, PWR_KPI_TABLE]
+    ]
+
+    write_local_pwr_db(settings["pwr_local_db"], *df_views)
+
+#Staff role each subprofession is mapped to by the pipeline (NaN if none)
+#Matches nwfs_staff_role_fuzzy_mapping, where later lookup rows take priority
+def lookup_staff_roles(subprofessions, df_lookup):
+
+    subprofessions = pd.Series(subprofessions)
+    roles = pd.Series(np.nan, index=subprofessions.index, dtype=object)
+
+    for fuzzy_name, front_name in df_lookup.iloc[:, :2].itertuples(
+            index=False):
+        roles[subprofessions.str.contains(fuzzy_name).to_numpy()] = front_name
+
+    return roles.to_numpy()
+
+#Generate PWR view tables for load testing the pipeline
+#The subprofessions are the fuzzy names from the staff role lookup so they
+#are mapped to the same staff roles as the source names
+#i.e. write_local_pwr_db(path, *generate_pwr_tables(10, org_codes, df_flu))
+def generate_pwr_tables(years, org_codes, df_lookup, start_year=2015, seed=0):
+
+    subprofessions = df_lookup.iloc[:, 0].tolist()
+    shorthands = dict(zip(subprofessions, df_lookup.iloc[:, 2]))
+
+    #Every generated subprofession must map back to its own staff role
+    roles = lookup_staff_roles(subprofessions, df_lookup)
+    unmapped = [subprofession for subprofession, role, front_name
+                in zip(subprofessions, roles, df_lookup.iloc[:, 1])
+                if role != front_name]
+    if unmapped:
+        raise ValueError(
+            "Generated subprofessions do not map to their staff role: " +
+            ", ".join(unmapped))
+
+    rng = np.random.default_rng(seed)
+
+    fyears = [f"{year}-{str(year + 1)[2:]}"
+              for year in range(start_year, start_year + years)]
+    contracts = ["Substantive", "Bank", "Agency"]
+
+    df_wte = pd.MultiIndex.from_product(
+        [fyears, range(1, 13), org_codes, subprofessions, contracts],
+        names=["fyear", "month", "org_code", "subprofession", "contract"]
+    ).to_frame(index=False)
+    df_wte["profession"] = "Allied Health Professionals"
+    df_wte["type"] = "Subprofession"
+    df_wte["shorthand"] = df_wte["subprofession"].map(shorthands)
+    df_wte["count"] = np.round(
+        rng.gamma(2.0, 10.0, df_wte.shape[0]) *
+        np.where(df_wte["contract"] == "Substantive", 5, 1), 2)
+
+    df_kpi = df_wte[df_wte["contract"] == "Substantive"][
+        ["fyear", "month", "org_code", "subprofession"]].reset_index(drop=True)
+    df_kpi["profession"] = "Allied Health Professionals"
+    df_kpi["type"] = "Subprofession"
+    df_kpi["vacancy"] = np.round(rng.gamma(1.5, 2.0, df_kpi.shape[0]), 2)
+
+    return df_wte, df_kpi
@@ -3,12 +3,20 @@ Pipeline for outputs sourced from the PWR Forms (in Sandpit)
 '''
 
 import pandas as pd
-import ncl_sqlsnippets as snips
 
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import seaborn as sns
 
+from utils.dimensions import (
+    load_dimensions, add_period_dimension, group_sum, encode,
+    fin_month_calendar, fin_month_key)
+from utils.trend_analytics import *
+from utils.snapshots import snapshot_run
+from utils.pwr_sources import load_pwr_source
+from utils.targets import pipeline_targets, requires_trends
+from utils.time_axis import format_fin_year_axis, downsample_series
+
 #Find all unique column values for a specified column that contains the target
 #I am fully aware this is not what fuzzy matching is
 def fuzzy_search(df, col_name, target_string):
@@ -21,8 +29,8 @@ def fuzzy_search(df, col_name, target_string):
 #Function to map src data staff roles to consistent front end names
 def nwfs_staff_role_fuzzy_mapping(df, settings):
 
-    #Load the AHP staff role map
-    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
+    #AHP staff role map (see load_dimensions)
+    df_flu = settings["dimensions"]["role_lookup"]
 
     #Build the map of existing row names to front end names
     sr_map = {}
@@ -48,41 +56,24 @@ def nwfs_staff_role_fuzzy_mapping(df, settings):
     
     return df
 
-#Zero fill for column values that do not appear in the data
-def zero_fill(df, column_name, column_values):
-
-    #Create copy of the input data frame
-    df_zfed = df.copy()
-    num_of_cols = df_zfed.shape[1]
-    dummy_row = []
-    for i in range(num_of_cols):
-        dummy_row.append(None)
-
-    #Get list of values that do appear in the data
-    values_in_data = df[column_name].unique()
-
-    #Add dummy rows for the missing data
-    for value in column_values:
-        if value not in values_in_data:
-            df_zfed.loc[df_zfed.shape[0]] = dummy_row
-            df_zfed.loc[df_zfed.shape[0]-1][column_name] = 0
-
-    return df_zfed
-
-#Load and execute the PWR SQL Query
+#Load the PWR data from the data source set in the settings
 def load_pwr_data(settings):
-    #Load the query script
-    f = open(f"./docs/pwr_extract.sql", 'r')
-    sql_query = f.read()
-    f.close()
 
-    #Execute the query and load the data
-    engine = snips.connect(settings["sql_address"], settings["pwr_database"])
-    df_res = snips.execute_sfw(engine, sql_query)
+    #Execute the extract query and load the data
+    df_res = load_pwr_source(settings)
 
     #Apply fuzzy matching functions
     df_res = nwfs_staff_role_fuzzy_mapping(df_res, settings)
 
+    #Add the Org Shorthand column (orgs outside of scope keep their code)
+    org_map = dict(zip(settings["org_codes"], settings["org_shorts"]))
+    df_res["org_shorthand"] = df_res["org_code"].map(org_map).fillna(
+        df_res["org_code"])
+
+    #Financial year and month combined into a sortable key
+    df_res["period_key"] = fin_month_key(
+        df_res["fin_year"], df_res["fin_month"])
+
     return df_res
 
 #Plot AHP WTE trend by contract
@@ -93,11 +84,16 @@ def plot_wte_by_contract(df, settings):
     axes = axes.flatten()
 
     #Aggregate data
-    df_agg = df.copy()[["fin_year", "fin_month", "contract", "wte"]].groupby(
-        ['fin_year', 'fin_month', "contract"], as_index=False)['wte'].sum()
-    
-    #Add combined date column
-    df_agg["period"] = df_agg["fin_year"] + "_" + df_agg["fin_month"].astype(str)
+    dimensions = settings["dimensions"]
+    df_agg = group_sum(df, ["period_key", "contract"], ["wte"], dimensions)
+
+    #Position of each period on the x axis (its place in the calendar)
+    calendar = dimensions["period_calendar"]
+    df_agg["period"] = encode(df_agg["period_key"], dimensions["period_key"])
+
+    #Reduce the number of points drawn for long histories
+    df_agg = downsample_series(
+        df_agg, "period", "wte", "contract", settings["pwr_max_points"])
     
     #Split data into substantive and non-substantive
     df_sub = df_agg[df_agg["contract"] == "Substantive"]
@@ -105,17 +101,6 @@ def plot_wte_by_contract(df, settings):
 
     dfs = [df_sub, df_temp]
 
-    #Pre-calculate x axis formatting variables
-    xticks_months = df_sub["fin_month"].to_list()
-    #Convert months into names
-    month_map = {1:"Apr", 2:"May", 3:"Jun", 4:"Jul",
-                 5:"Aug", 6:"Sep", 7:"Oct", 8:"Nov",
-                 9:"Dec", 10:"Jan", 11:"Feb", 12:"Mar"}
-    xticks_months = [month_map[item] for item in xticks_months]
-
-    xticks_years = df_sub["fin_year"].unique()
-    #xticks_years = ["\n\n\n" + s for s in xticks_years]
-
     # Loop over each axis and plot the barplots
     for i, ax in enumerate(axes):
         #Get data for this axes
@@ -143,22 +128,11 @@ def plot_wte_by_contract(df, settings):
         #Remove box from graphs
         sns.despine()
 
-        #Format the primary x axis (months)
-        ax.set_xticks(range(len(xticks_months)))
-        ax.set_xticklabels(xticks_months, rotation=90)
-        ax.tick_params("x", width=1)
-        ax.set_xlabel(None)
-
-        #Add the Year Labels
-        sec = ax.secondary_xaxis(location=0)
-        sec.set_xticks([5.5,17.5,26.5], labels=xticks_years)
-        sec.tick_params("x", length=0, pad=35)
-        
-        #Add Seperators for the years
-        sec2 = ax.secondary_xaxis(location=0)
-        sec2.set_xticks([-0.5, 11.5, 23.5, 29.5], labels=[])
-        sec2.tick_params("x", length=40, width=1)
-        ax.set_xlim(-0.6, 29.6)
+        #Add the month and year labels
+        format_fin_year_axis(
+            ax, 
+            calendar["fin_year"].to_list(), 
+            calendar["fin_month"].to_list())
 
         # Format the titles and axes
         ax.set_title(f"NCL Secondary Care AHP - SIP Trend ({ax_name})", 
@@ -176,24 +150,18 @@ def plot_wte_by_contract(df, settings):
                 dpi=300, bbox_inches='tight')
 
 #Plot function for vacancy by AHP staff role
-def plot_yoy_by_role_raw(df, settings):
-    #Sort the data by the x axis column
-    df.sort_values(by='staff_role_shorthand', inplace=True)
+#df_trend is the period x staff role slice of the trend metrics
+def plot_yoy_by_role_raw(df_trend, settings):
 
     #Load list of AHP roles (shorthand)
-    df_flu = pd.read_csv("docs/nwfs_lookup.csv")
-    ahp_roles = df_flu["role_shorthand"].unique()
-    ahp_roles.sort()
+    df_flu = settings["dimensions"]["role_lookup"]
+    ahp_roles = settings["dimensions"]["staff_role_shorthand"]
 
     #Filter to only data with the most recent month
-    month_latest = df[df["fin_year"] == df["fin_year"].max()]["fin_month"].max()
-    df_month = df[df["fin_month"] == month_latest]
+    month_latest = df_trend["period_datapoint"].iloc[-1].split("-")[0]
+    df_trend = df_trend[
+        df_trend["period_datapoint"].str.startswith(month_latest)]
 
-    #Aggregate data
-    df_trend = df_month.groupby(
-        ['period_datapoint', 'staff_role_shorthand'], as_index=False
-        )['vacancy'].sum()
-    
     periods = len(df_trend["period_datapoint"].unique())
 
     fig, axes = plt.subplots(
@@ -207,7 +175,7 @@ def plot_yoy_by_role_raw(df, settings):
         x="staff_role_shorthand", 
         y="vacancy",
         hue="period_datapoint",
-        data=zero_fill(df_trend, "staff_role_shorthand", ahp_roles),
+        data=df_trend,
         order=ahp_roles,
         ax=axes[0],
         palette=ncl_palette
@@ -245,16 +213,66 @@ def plot_yoy_by_role_raw(df, settings):
     plt.savefig('./output/pwr/vac_raw_by_role.png', 
                 dpi=300, bbox_inches='tight')
 
+#Build the trend cube and metrics (period x org x staff role x contract)
+def build_pwr_trends(df, settings):
+
+    cube = build_cube(
+        df,
+        dims=["org_shorthand", "staff_role_shorthand", "contract"],
+        values=["wte", "vacancy"],
+        dimensions=settings["dimensions"],
+        extend=["org_shorthand", "contract"]
+    )
+    cube = add_totals(cube)
+
+    #Vacancies are only joined to Substantive rows by the extract
+    metrics = trend_metrics(
+        cube, "wte", rolling_windows=[3, 12],
+        vacancy_slice=("contract", "Substantive"))
+
+    #Vacancy trend metrics (the vacancy rate is already included for wte)
+    metrics_vac = trend_metrics(cube, "vacancy", rolling_windows=[3, 12])
+    metrics.update(
+        {metric: arr for metric, arr in metrics_vac.items()
+         if metric not in metrics})
+
+    return cube, metrics_to_frame(cube, metrics)
+
 #Main function for the pipeline
 def pwr_trends(settings):
 
-    #Load the data from the Sandpit
+    #Targets to build for this run
+    targets = pipeline_targets(settings, "pipeline_pwr")
+
+    #Dimension tables (orgs, staff roles, contracts) used by the outputs
+    settings = {**settings, "dimensions": load_dimensions(settings)}
+
+    #Load the data from the Sandpit (or local database)
     df_pwr = load_pwr_data(settings=settings)
 
+    #Complete monthly calendar so missing months are left empty
+    settings["dimensions"] = add_period_dimension(
+        settings["dimensions"],
+        fin_month_calendar(df_pwr["fin_year"], df_pwr["fin_month"]))
+
     #Line chart showing trend by contract
-    plot_wte_by_contract(df_pwr, settings)
+    if "pwr/wte_trend" in targets:
+        plot_wte_by_contract(df_pwr, settings)
 
     #print(df_pwr.head())
 
+    if not requires_trends(targets):
+        return
+
+    #Calculate the trend metrics
+    cube, df_trends = build_pwr_trends(df_pwr, settings)
+    if "pwr/pwr_trend_metrics" in targets:
+        df_trends.to_csv("./output/pwr/pwr_trend_metrics.csv", index=False)
+
+    #Save the aggregated results and report the change since the last run
+    snapshot_run("pwr", cube)
+
     #Bar plot showing year on year growth for each role
-    plot_yoy_by_role_raw(df_pwr, settings)
+    if "pwr/vac_raw_by_role" in targets:
+        plot_yoy_by_role_raw(
+            select_slice(df_trends, cube, ["staff_role_shorthand"]), settings)
\ No newline at end of file
@@ -2,39 +2,93 @@ import datetime
 import json
 import toml
 from os import getenv
+from pathlib import Path
 from dotenv import load_dotenv
 
-def load_runtime_settings():
+#Root of the project (the directory containing config.toml and .env)
+PROJECT_PATH = Path(__file__).resolve().parents[2]
+
+def load_runtime_settings(overrides=None):
 
     #Load env settings
-    load_dotenv(override=True)
+    load_dotenv(PROJECT_PATH / ".env", override=True)
 
     #Load toml settings from config
-    config = toml.load("./config.toml")
+    config = toml.load(PROJECT_PATH / "config.toml")
 
     #Base settings
     #These settings should remain unchanged and are combined with toml and env
     #settings to build the settings dict.
-    base_path = "data/"
+    base_path = PROJECT_PATH / "data"
     base_scope = "scope"
     base_pipeline_nwfs = "nhs_workforce_statistics"
     base_pipeline_pwr = "pwr_trends"
 
     #Store both the config and env settings in a dict
     settings = {
+        "project_path": str(PROJECT_PATH),
+
         "pipeline_nwfs": getenv("PIPELINE_NWFS") in ["True", "true", 1],
         "pipeline_pwr": getenv("PIPELINE_PWR") in ["True", "true", 1],
 
+        #Output targets to build (None builds all targets)
+        "targets": None,
+
         "org_codes": config[base_scope]["org_codes"],
         "org_shorts": config[base_scope]["org_shorts"],
         "sql_address": getenv("SQL_ADDRESS"),
 
-        "nwfs_path": base_path + config[base_pipeline_nwfs]["rel_path"],
+        "nwfs_path": str(base_path / config[base_pipeline_nwfs]["rel_path"]),
         "nwfs_colahp": config[base_pipeline_nwfs]["colname_ahp"],
         "nwfs_colrole": config[base_pipeline_nwfs]["colname_role"],
         "nwfs_colband": config[base_pipeline_nwfs]["colname_band"],
 
-        "pwr_database": config[base_pipeline_pwr]["database"]
+        "pwr_database": config[base_pipeline_pwr]["database"],
+        "pwr_source": config[base_pipeline_pwr]["source"],
+        "pwr_local_db": str(base_path / config[base_pipeline_pwr]["local_db"]),
+        "pwr_max_points": config[base_pipeline_pwr]["max_points"]
     }
 
-    return settings
\ No newline at end of file
+    #Apply any overrides (i.e. from command line flags) that have been set
+    if overrides:
+        for key, value in overrides.items():
+            if value is not None:
+                settings[key] = value
+
+    return settings
+
+#Check the settings for the enabled pipelines without loading any data
+#Returns a list of the issues found (empty if the settings are valid)
+def validate_runtime_settings(settings):
+
+    issues = []
+
+    if len(settings["org_codes"]) != len(settings["org_shorts"]):
+        issues.append("org_codes and org_shorts in config.toml " +
+                      "are not the same length.")
+
+    if settings["pipeline_nwfs"] or settings["pipeline_pwr"]:
+        lookup_path = Path(settings["project_path"]) / "docs/nwfs_lookup.csv"
+        if not lookup_path.is_file():
+            issues.append(f"Staff role lookup not found: {lookup_path}")
+
+    if settings["pipeline_nwfs"]:
+        nwfs_path = Path(settings["nwfs_path"])
+        if not nwfs_path.is_dir():
+            issues.append(f"NWFS data folder not found: {nwfs_path}")
+        elif not any(nwfs_path.iterdir()):
+            issues.append(f"NWFS data folder is empty: {nwfs_path}")
+
+    if settings["pipeline_pwr"]:
+        if settings["pwr_source"] == "sqlserver":
+            if not settings["sql_address"]:
+                issues.append(
+                    "SQL_ADDRESS is not set (required for PWR Pipeline).")
+        elif settings["pwr_source"] == "sqlite":
+            if not Path(settings["pwr_local_db"]).is_file():
+                issues.append(
+                    f"PWR local database not found: {settings['pwr_local_db']}")
+        else:
+            issues.append(f"Unknown PWR source: {settings['pwr_source']}")
+
+    return issues
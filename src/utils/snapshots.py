@@ -0,0 +1,180 @@
+'''
+Snapshot store for the aggregated pipeline results.
+
+Each run saves its trend cube (period x org x staff role x band/contract) as a
+compressed .npz file named by the source and latest period. Delta reports
+comparing two quarters are calculated from the stored snapshots without
+loading any of the source data.
+'''
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from utils.dimensions import encode
+from utils.trend_analytics import TOTAL_LABEL
+
+#Increment if the layout of the snapshot files changes
+SNAPSHOT_VERSION = 1
+
+#Folder the snapshots and delta reports are saved in
+SNAPSHOT_PATH = "./output/snapshots"
+
+#Name of the snapshot file for a cube (i.e. nwfs_2024-06-30.npz)
+def snapshot_name(source, cube):
+    period_key = re.sub(r"[^0-9A-Za-z_-]", "-", cube["period_keys"][-1])
+    return f"{source}_{period_key}.npz"
+
+#Save a cube as a snapshot and return the file path
+def save_snapshot(source, cube, path=SNAPSHOT_PATH):
+
+    #Snapshots are stored without the total slices (see add_totals)
+    values = cube["values"]
+    if cube.get("totals"):
+        ndim = len(cube["dims"]) + 1
+        index = (slice(None),) + (slice(0, -1),) * (ndim - 1)
+        values = {value: arr[index] for value, arr in values.items()}
+
+    arrays = {
+        "version": np.array(SNAPSHOT_VERSION),
+        "source": np.array(source),
+        "dims": np.array(cube["dims"], dtype=str),
+        "periods": np.array(cube["periods"], dtype=str),
+        "period_keys": np.array(cube["period_keys"], dtype=str)
+    }
+
+    for dim in cube["dims"]:
+        labels = cube["labels"][dim]
+        if cube.get("totals"):
+            labels = labels[:-1]
+        arrays[f"labels_{dim}"] = np.array(labels, dtype=str)
+
+    for value, arr in values.items():
+        arrays[f"values_{value}"] = arr
+
+    os.makedirs(path, exist_ok=True)
+    snapshot_file = os.path.join(path, snapshot_name(source, cube))
+    np.savez_compressed(snapshot_file, **arrays)
+
+    return snapshot_file
+
+#Load a snapshot file back into a cube
+def load_snapshot(snapshot_file):
+
+    with np.load(snapshot_file, allow_pickle=False) as data:
+
+        if int(data["version"]) != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"{snapshot_file} is snapshot version {int(data['version'])}" +
+                f", expected version {SNAPSHOT_VERSION}.")
+
+        dims = data["dims"].tolist()
+
+        return {
+            "source": str(data["source"]),
+            "periods": data["periods"].tolist(),
+            "period_keys": data["period_keys"].tolist(),
+            "dims": dims,
+            "labels": {dim: data[f"labels_{dim}"].tolist() for dim in dims},
+            "values": {name[len("values_"):]: data[name] for name in data.files
+                       if name.startswith("values_")}
+        }
+
+#Find the most recent snapshot for the same source before a snapshot
+def previous_snapshot(snapshot_file):
+
+    path, name = os.path.split(snapshot_file)
+    source = name.split("_")[0]
+
+    snapshots = sorted(
+        file for file in os.listdir(path)
+        if file.startswith(source + "_") and file.endswith(".npz")
+        and file < name)
+
+    if not snapshots:
+        return None
+
+    return os.path.join(path, snapshots[-1])
+
+#Reindex the latest period of a cube to the given labels (missing cells are 0)
+def latest_period_aligned(cube, value, labels):
+
+    arr = np.zeros(tuple(len(labels[dim]) for dim in cube["dims"]))
+    codes = [encode(cube["labels"][dim], labels[dim]) for dim in cube["dims"]]
+    arr[np.ix_(*codes)] = cube["values"][value][-1]
+
+    return arr
+
+#Compare the latest period of two snapshots
+#Returns the change for each label of every dimension and for the total
+def delta_report(cube_old, cube_new):
+
+    #Labels from both snapshots (in case orgs or roles have changed)
+    labels = {}
+    for dim in cube_new["dims"]:
+        labels[dim] = list(cube_old["labels"].get(dim, []))
+        labels[dim] += [label for label in cube_new["labels"][dim]
+                        if label not in labels[dim]]
+
+    values = [value for value in cube_new["values"]
+              if value in cube_old["values"]]
+
+    df_deltas = []
+    for value in values:
+        arr_old = latest_period_aligned(cube_old, value, labels)
+        arr_new = latest_period_aligned(cube_new, value, labels)
+
+        #Total for each label of each dimension
+        rows = [(TOTAL_LABEL, [TOTAL_LABEL], arr_old.sum(), arr_new.sum())]
+        for axis, dim in enumerate(cube_new["dims"]):
+            other_axes = tuple(i for i in range(arr_old.ndim) if i != axis)
+            rows.append((dim, labels[dim],
+                         arr_old.sum(axis=other_axes),
+                         arr_new.sum(axis=other_axes)))
+
+        for dim, dim_labels, old, new in rows:
+            old = np.atleast_1d(old)
+            new = np.atleast_1d(new)
+            change = new - old
+
+            df_deltas.append(pd.DataFrame({
+                "value": value,
+                "dimension": dim,
+                "label": dim_labels,
+                "period_old": cube_old["periods"][-1],
+                "period_new": cube_new["periods"][-1],
+                "old": old,
+                "new": new,
+                "change": change,
+                "pct_change": np.divide(
+                    change, old,
+                    out=np.full(old.shape, np.nan), where=old != 0)
+            }))
+
+    return pd.concat(df_deltas, ignore_index=True)
+
+#Write the delta report between two snapshot files and return the file path
+def write_delta_report(snapshot_old, snapshot_new, path=SNAPSHOT_PATH):
+
+    df_delta = delta_report(
+        load_snapshot(snapshot_old), load_snapshot(snapshot_new))
+
+    name_old = os.path.splitext(os.path.basename(snapshot_old))[0]
+    name_new = os.path.splitext(os.path.basename(snapshot_new))[0]
+
+    os.makedirs(path, exist_ok=True)
+    delta_file = os.path.join(path, f"delta_{name_old}_vs_{name_new}.csv")
+    df_delta.to_csv(delta_file, index=False)
+
+    return delta_file
+
+#Save the snapshot for a run and report the change since the last snapshot
+def snapshot_run(source, cube):
+
+    snapshot_file = save_snapshot(source, cube)
+    print(f"Saved snapshot: {snapshot_file}")
+
+    snapshot_old = previous_snapshot(snapshot_file)
+    if snapshot_old is not None:
+        delta_file = write_delta_report(snapshot_old, snapshot_file)
+        print(f"Saved delta report: {delta_file}")
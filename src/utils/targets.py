@@ -0,0 +1,76 @@
+'''
+Registry of the named output targets produced by the pipelines.
+
+Each target declares the pipeline it belongs to, the periods of source data it
+needs and whether it depends on the trend metrics. This is used to run only
+the stages required for a requested subset of targets (i.e. --only wte_by_role).
+'''
+
+#Periods of source data required by a target
+PERIODS_LATEST = "latest"
+PERIODS_ALL = "all"
+
+#Targets are named by their path in the output folder (without the extension)
+#Outputs in output/current are named without the folder
+TARGETS = {
+    "wte_by_afcband": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_LATEST, "trends": False
+    },
+    "wte_by_org": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_LATEST, "trends": False
+    },
+    "wte_by_role": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_LATEST, "trends": False
+    },
+    "trends/by_org": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_ALL, "trends": True
+    },
+    "trends/by_role": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_ALL, "trends": True
+    },
+    "trends/nwfs_trend_metrics": {
+        "pipeline": "pipeline_nwfs", "periods": PERIODS_ALL, "trends": True
+    },
+    "pwr/wte_trend": {
+        "pipeline": "pipeline_pwr", "periods": PERIODS_ALL, "trends": False
+    },
+    "pwr/vac_raw_by_role": {
+        "pipeline": "pipeline_pwr", "periods": PERIODS_ALL, "trends": True
+    },
+    "pwr/pwr_trend_metrics": {
+        "pipeline": "pipeline_pwr", "periods": PERIODS_ALL, "trends": True
+    },
+}
+
+#Convert a comma separated list of targets into a list of target names
+def parse_targets(targets_str):
+
+    targets = [target.strip() for target in targets_str.split(",")
+               if target.strip()]
+
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown:
+        raise ValueError(
+            f"Unknown target(s): {', '.join(unknown)}. " +
+            f"Valid targets are: {', '.join(TARGETS)}")
+
+    return targets
+
+#Get the targets to build for a pipeline (all of them if none were requested)
+def pipeline_targets(settings, pipeline):
+
+    targets = settings.get("targets")
+    if targets is None:
+        targets = list(TARGETS)
+
+    return [target for target in targets
+            if TARGETS[target]["pipeline"] == pipeline]
+
+#Check if only the latest period of source data is needed for the targets
+def requires_latest_only(targets):
+    return all(TARGETS[target]["periods"] == PERIODS_LATEST
+               for target in targets)
+
+#Check if the trend metrics are needed for the targets
+def requires_trends(targets):
+    return any(TARGETS[target]["trends"] for target in targets)
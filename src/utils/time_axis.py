@@ -0,0 +1,127 @@
+'''
+Time axis formatting for monthly financial year series.
+
+The month labels, financial year labels and year separators are calculated
+from the data so any length of history can be plotted. Long series can be
+downsampled using Largest-Triangle-Three-Buckets (LTTB) which keeps the
+shape of the series while reducing the number of points drawn.
+'''
+import numpy as np
+
+#Financial month number to month name
+MONTH_NAMES = {1:"Apr", 2:"May", 3:"Jun", 4:"Jul",
+               5:"Aug", 6:"Sep", 7:"Oct", 8:"Nov",
+               9:"Dec", 10:"Jan", 11:"Feb", 12:"Mar"}
+
+#Calculate the financial year label positions and separators for an axis
+#fin_years is the financial year of each position on the axis (in order)
+def fin_year_ticks(fin_years):
+
+    fin_years = np.asarray(fin_years)
+    n = len(fin_years)
+
+    #Index of the first position of each financial year
+    starts = np.flatnonzero(np.r_[True, fin_years[1:] != fin_years[:-1]])
+    ends = np.r_[starts[1:], n]
+
+    label_ticks = (starts + ends - 1) / 2
+    labels = fin_years[starts].tolist()
+    separators = np.r_[starts, n] - 0.5
+
+    return label_ticks, labels, separators
+
+#Month label spacings that divide a financial year evenly
+MONTH_STEPS = [1, 2, 3, 4, 6, 12]
+
+#Format the x axis of a monthly plot with month and financial year labels
+#Data should be plotted with x as the position (0 to n-1) of each period
+#Histories longer than max_month_years only have the year labels
+def format_fin_year_axis(ax, fin_years, fin_months, max_month_labels=36,
+                         max_month_years=6, max_year_labels=6):
+
+    fin_months = np.asarray(fin_months)
+    n = len(fin_months)
+    show_months = len(set(fin_years)) <= max_month_years
+
+    if show_months:
+        #Label every step months starting from April so each year is the same
+        step = next((step for step in MONTH_STEPS
+                     if n / step <= max_month_labels), MONTH_STEPS[-1])
+        month_ticks = np.flatnonzero((fin_months - 1) % step == 0)
+
+        #Format the primary x axis (months)
+        ax.set_xticks(month_ticks)
+        ax.set_xticklabels(
+            [MONTH_NAMES[fin_months[i]] for i in month_ticks], rotation=90)
+        ax.tick_params("x", width=1)
+    else:
+        ax.set_xticks([])
+    ax.set_xlabel(None)
+
+    label_ticks, labels, separators = fin_year_ticks(fin_years)
+
+    #Thin out the year labels for long histories (separators are kept)
+    year_step = max(1, int(np.ceil(len(labels) / max_year_labels)))
+    label_ticks = label_ticks[::year_step]
+    labels = labels[::year_step]
+
+    #Add the Year Labels
+    sec = ax.secondary_xaxis(location=0)
+    sec.set_xticks(label_ticks, labels=labels)
+    sec.tick_params("x", length=0, pad=35 if show_months else 5)
+
+    #Add Seperators for the years
+    sec2 = ax.secondary_xaxis(location=0)
+    sec2.set_xticks(separators, labels=[])
+    sec2.tick_params("x", length=40 if show_months else 15, width=1)
+    ax.set_xlim(-0.6, n - 0.4)
+
+#Largest-Triangle-Three-Buckets downsampling
+#Returns the indices of the threshold points to keep (including both ends)
+def lttb(x, y, threshold):
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    #Bucket edges for the points between the first and last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    idx = np.empty(threshold, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        #Average of the next bucket (the last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        #Keep the point forming the largest triangle with the previous point
+        #and the next bucket average
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + np.argmax(area)
+        idx[i + 1] = a
+
+    return idx
+
+#Downsample each series in a long data frame to at most threshold points
+def downsample_series(df, x, y, group, threshold):
+
+    indices = []
+    for _, df_group in df.sort_values(x).groupby(group, sort=False):
+        keep = lttb(df_group[x], df_group[y], threshold)
+        indices.append(df_group.index.to_numpy()[keep])
+
+    if not indices:
+        return df
+
+    return df.loc[np.concatenate(indices)]
@@ -0,0 +1,229 @@
+'''
+Vectorised trend analytics shared by the NWFS and PWR pipelines.
+
+The source data is pivoted into a dense NumPy array with the period as the
+first axis followed by one axis per dimension (org, role, band, contract).
+Growth and rolling metrics are then calculated for every slice at once.
+'''
+import numpy as np
+import pandas as pd
+
+from utils.dimensions import (
+    dimension_labels, encode, bincount_sum, year_ago_index)
+
+#Label used for the aggregate slice added to each dimension
+TOTAL_LABEL = "All"
+
+#Pivot a long data frame into a dense period x dim_1 x ... x dim_n cube
+#The period axis is the period calendar in the dimension tables (see
+#add_period_dimension), matched on the period_key column, periods without
+#data are left as NaN
+#Axis labels are taken from the dimension tables where available
+def build_cube(df, dims, values, dimensions, extend=()):
+
+    calendar = dimensions["period_calendar"]
+
+    #Drop rows that cannot be placed on an axis (i.e. unmapped staff roles)
+    df = df.dropna(subset=["period_key"] + dims)
+
+    #Dimension axes (dims in extend also include values not in the tables)
+    axes_labels = [dimensions["period_key"]] + [
+        dimension_labels(df, dim, dimensions, extend=dim in extend)
+        for dim in dims]
+    shape = tuple(len(labels) for labels in axes_labels)
+
+    #Sum each value column into the cube in a single pass
+    cube_values, counts = bincount_sum(
+        [encode(df[col], labels)
+         for col, labels in zip(["period_key"] + dims, axes_labels)],
+        shape,
+        {value: df[value].to_numpy() for value in values})
+
+    #Leave the gaps in the calendar empty
+    period_empty = counts.reshape(shape[0], -1).sum(axis=1) == 0
+    for arr in cube_values.values():
+        arr[period_empty] = np.nan
+
+    return {
+        "periods": calendar["period_datapoint"].tolist(),
+        "period_keys": calendar["period_key"].tolist(),
+        "period_dates": calendar["period_date"].to_numpy(),
+        "dims": dims,
+        "labels": dict(zip(dims, axes_labels[1:])),
+        "values": cube_values
+    }
+
+#Append a total slice to every dimension axis so the aggregate slices
+#(i.e. NCL overall, all roles) are included in every metric
+def add_totals(cube):
+
+    cube_totals = {
+        "periods": cube["periods"],
+        "period_keys": cube["period_keys"],
+        "period_dates": cube["period_dates"],
+        "dims": cube["dims"],
+        "totals": True,
+        "labels": {dim: cube["labels"][dim] + [TOTAL_LABEL]
+                   for dim in cube["dims"]},
+        "values": {}
+    }
+
+    for value, arr in cube["values"].items():
+        for axis in range(1, arr.ndim):
+            arr = np.concatenate(
+                [arr, arr.sum(axis=axis, keepdims=True)], axis=axis)
+        cube_totals["values"][value] = arr
+
+    return cube_totals
+
+#Get the value of the period at prev_index for each period (NaN if -1)
+def shift_periods(arr, prev_index):
+    arr_shift = np.full(arr.shape, np.nan)
+    has_prev = prev_index >= 0
+    arr_shift[has_prev] = arr[prev_index[has_prev]]
+    return arr_shift
+
+#Divide two arrays returning NaN where the denominator is 0
+def safe_divide(num, den):
+    num, den = np.broadcast_arrays(
+        np.asarray(num, dtype=float), np.asarray(den, dtype=float))
+    res = np.full(num.shape, np.nan)
+    np.divide(num, den, out=res, where=(den != 0) & ~np.isnan(den))
+    return res
+
+#Change against the period at prev_index (absolute and relative)
+def period_change(arr, prev_index):
+    arr_prev = shift_periods(arr, prev_index)
+    change = arr - arr_prev
+    return change, safe_divide(change, arr_prev)
+
+#Trailing mean over the last window periods using a cumulative sum
+#Windows including an empty (NaN) period are NaN
+def rolling_mean(arr, window):
+
+    pad = np.zeros((1,) + arr.shape[1:])
+    arr_cs = np.concatenate(
+        [pad, np.cumsum(np.nan_to_num(arr, nan=0.0), axis=0)], axis=0)
+    valid_cs = np.concatenate(
+        [pad, np.cumsum(~np.isnan(arr), axis=0)], axis=0)
+
+    arr_rm = np.full(arr.shape, np.nan)
+    if window > arr.shape[0]:
+        return arr_rm
+
+    window_sum = arr_cs[window:] - arr_cs[:-window]
+    window_valid = valid_cs[window:] - valid_cs[:-window]
+    arr_rm[window - 1:] = np.where(
+        window_valid == window, window_sum / window, np.nan)
+
+    return arr_rm
+
+#Compound annual growth rate between the first and last period
+def cagr(arr, years):
+    if years <= 0:
+        return np.full(arr.shape[1:], np.nan)
+    ratio = safe_divide(arr[-1], arr[0])
+    res = np.full(ratio.shape, np.nan)
+    np.power(ratio, 1 / years, out=res, where=ratio > 0)
+    return res - 1
+
+#Vacancy rate as vacancy / (wte + vacancy)
+def vacancy_rate(wte, vacancy):
+    return safe_divide(vacancy, wte + vacancy)
+
+#Vacancy rate when vacancies are only recorded against one label of a
+#dimension (i.e. PWR vacancies are only joined to Substantive contracts)
+#The rate uses the WTE of that label and is NaN for the other labels, the
+#total slice uses the same rate as the label the vacancies belong to
+def slice_vacancy_rate(cube, wte, vacancy, dim, label):
+
+    rate = np.full(wte.shape, np.nan)
+
+    labels = cube["labels"][dim]
+    if label not in labels:
+        return rate
+
+    axis = cube["dims"].index(dim) + 1
+    index_label = [labels.index(label)]
+    rate_label = vacancy_rate(
+        np.take(wte, index_label, axis=axis),
+        np.take(vacancy, index_label, axis=axis))
+
+    for target in [label, TOTAL_LABEL]:
+        if target in labels:
+            index = [slice(None)] * wte.ndim
+            index[axis] = [labels.index(target)]
+            rate[tuple(index)] = rate_label
+
+    return rate
+
+#Calculate the trend metrics for every slice of the cube
+#YoY compares each period with the same month a year before and CAGR uses
+#the number of years between the first and last period dates
+#vacancy_slice is the (dim, label) vacancies are recorded against (if any)
+def trend_metrics(cube, value, rolling_windows=(), vacancy_slice=None):
+
+    arr = cube["values"][value]
+
+    yoy_change, yoy_pct = period_change(
+        arr, year_ago_index(cube["period_dates"]))
+
+    period_dates = pd.DatetimeIndex(cube["period_dates"])
+    years = (period_dates[-1] - period_dates[0]).days / 365.25
+
+    metrics = {
+        value: arr,
+        f"{value}_yoy_change": yoy_change,
+        f"{value}_yoy_pct": yoy_pct,
+        #CAGR has no period axis so is repeated across all periods
+        f"{value}_cagr": np.broadcast_to(cagr(arr, years), arr.shape)
+    }
+
+    for window in rolling_windows:
+        metrics[f"{value}_rolling_{window}"] = rolling_mean(arr, window)
+
+    if "vacancy" in cube["values"] and value != "vacancy":
+        metrics["vacancy"] = cube["values"]["vacancy"]
+        if vacancy_slice is None:
+            metrics["vacancy_rate"] = vacancy_rate(
+                arr, cube["values"]["vacancy"])
+        else:
+            metrics["vacancy_rate"] = slice_vacancy_rate(
+                cube, arr, cube["values"]["vacancy"], *vacancy_slice)
+
+    return metrics
+
+#Flatten the metric arrays into a long data frame (one row per cell)
+#period_key is included so the rows can be sorted and joined to the source
+def metrics_to_frame(cube, metrics):
+
+    axes_labels = [cube["periods"]] + [cube["labels"][dim]
+                                       for dim in cube["dims"]]
+    grid = np.meshgrid(
+        *[np.asarray(labels, dtype=object) for labels in axes_labels],
+        indexing="ij")
+
+    df_metrics = pd.DataFrame(
+        {col: labels.ravel()
+         for col, labels in zip(["period_datapoint"] + cube["dims"], grid)})
+    df_metrics.insert(1, "period_key", np.repeat(
+        np.asarray(cube["period_keys"], dtype=object),
+        grid[0].size // len(cube["period_keys"])))
+
+    for metric, arr in metrics.items():
+        df_metrics[metric] = np.asarray(arr).ravel()
+
+    return df_metrics
+
+#Select the rows of a metric frame for the given dims with all other
+#dimensions set to the total slice
+def select_slice(df_metrics, cube, keep):
+
+    mask = np.ones(df_metrics.shape[0], dtype=bool)
+    for dim in cube["dims"]:
+        if dim in keep:
+            mask &= (df_metrics[dim] != TOTAL_LABEL).to_numpy()
+        else:
+            mask &= (df_metrics[dim] == TOTAL_LABEL).to_numpy()
+
+    return df_metrics[mask].reset_index(drop=True)
@@ -1,23 +1,177 @@
 '''
 Script to execute the pipelines involved in the AHP Workforce Report generation. 
+
+The dependencies for each pipeline (pandas, matplotlib, ncl_sqlsnippets etc.)
+are only imported when that pipeline is enabled.
 '''
-from utils.runtime_settings import load_runtime_settings
+import argparse
+import os
+import sys
+
+from utils.runtime_settings import (
+    load_runtime_settings, validate_runtime_settings)
+from utils.targets import TARGETS, parse_targets
+
+#Command line flags (these override the .env settings)
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Generate the visuals for the AHP Workforce Report.")
+
+    parser.add_argument(
+        "--nwfs", dest="pipeline_nwfs",
+        action=argparse.BooleanOptionalAction, default=None,
+        help="Execute the NHS Workforce Statistics Pipeline (PIPELINE_NWFS)")
+    parser.add_argument(
+        "--pwr", dest="pipeline_pwr",
+        action=argparse.BooleanOptionalAction, default=None,
+        help="Execute the PWR Pipeline (PIPELINE_PWR)")
+    parser.add_argument(
+        "--sql-address", dest="sql_address", default=None,
+        help="Connection address of the Sandpit (SQL_ADDRESS)")
+    parser.add_argument(
+        "--database", dest="pwr_database", default=None,
+        help="Database containing the PWR views")
+    parser.add_argument(
+        "--only", dest="targets", default=None,
+        help="Comma separated list of the outputs to build " +
+             f"(options: {', '.join(TARGETS)})")
+    parser.add_argument(
+        "--pwr-source", dest="pwr_source", default=None,
+        choices=["sqlserver", "sqlite"],
+        help="Data source for the PWR Pipeline")
+    parser.add_argument(
+        "--pwr-local-db", dest="pwr_local_db", default=None,
+        help="Path of the local database used by the sqlite PWR source")
+    parser.add_argument(
+        "--cache-pwr", action="store_true",
+        help="Copy the PWR views from the Sandpit into the local database " +
+             "(no pipelines are executed)")
+    parser.add_argument(
+        "--generate-pwr", dest="generate_pwr", type=int, default=None,
+        metavar="YEARS",
+        help="Fill the local database with generated PWR views covering " +
+             "YEARS financial years for load testing " +
+             "(no pipelines are executed)")
+    parser.add_argument(
+        "--delta", nargs=2, metavar=("OLD", "NEW"), default=None,
+        help="Write the delta report between two snapshot files " +
+             "(no pipelines are executed)")
+    parser.add_argument(
+        "--validate", action="store_true",
+        help="Only validate the settings, do not execute the pipelines")
+
+    return parser.parse_args(argv)
+
+#Main function for the script
+def main(argv=None):
+
+    args = parse_args(argv)
+
+    # Load runtime settings
+    overrides = vars(args).copy()
+    validate_only = overrides.pop("validate")
+    delta_snapshots = overrides.pop("delta")
+    if delta_snapshots is not None:
+        delta_snapshots = [os.path.abspath(file) for file in delta_snapshots]
+    cache_pwr = overrides.pop("cache_pwr")
+    generate_pwr = overrides.pop("generate_pwr")
+    if overrides["pwr_local_db"] is not None:
+        overrides["pwr_local_db"] = os.path.abspath(overrides["pwr_local_db"])
+
+    #Only enable the pipelines needed for the requested targets
+    if args.targets is not None:
+        if args.pipeline_nwfs is not None or args.pipeline_pwr is not None:
+            print("Settings issue: --nwfs and --pwr cannot be used with " +
+                  "--only (the pipelines are set by the outputs).")
+            return 1
+
+        try:
+            overrides["targets"] = parse_targets(args.targets)
+        except ValueError as e:
+            print(e)
+            return 1
+
+        for pipeline in ["pipeline_nwfs", "pipeline_pwr"]:
+            overrides[pipeline] = any(
+                TARGETS[target]["pipeline"] == pipeline
+                for target in overrides["targets"])
+
+    settings = load_runtime_settings(overrides=overrides)
+
+    #Relative paths (docs/, output/) are resolved from the project folder
+    os.chdir(settings["project_path"])
+
+    #Delta report between two stored snapshots
+    if delta_snapshots is not None:
+        from utils.snapshots import write_delta_report
+
+        delta_file = write_delta_report(*delta_snapshots)
+        print(f"Saved delta report: {delta_file}")
+        return 0
+
+    #Copy the PWR views into the local database
+    if cache_pwr:
+        if not settings["sql_address"]:
+            print("Settings issue: " +
+                  "SQL_ADDRESS is not set (required for --cache-pwr).")
+            return 1
+
+        from utils.pwr_sources import cache_pwr_views
+
+        cache_pwr_views(settings)
+        print(f"Saved PWR views to: {settings['pwr_local_db']}")
+        return 0
+
+    #Fill the local database with generated PWR views
+    if generate_pwr is not None:
+        if generate_pwr < 1:
+            print("Settings issue: --generate-pwr needs at least 1 year")
+            return 1
+
+        from utils.dimensions import load_dimensions
+        from utils.pwr_sources import generate_pwr_tables, write_local_pwr_db
+
+        try:
+            df_views = generate_pwr_tables(
+                generate_pwr, settings["org_codes"],
+                load_dimensions(settings)["role_lookup"])
+        except ValueError as e:
+            print(e)
+            return 1
+
+        write_local_pwr_db(settings["pwr_local_db"], *df_views)
+        print(f"Saved generated PWR views to: {settings['pwr_local_db']}")
+        return 0
+
+    issues = validate_runtime_settings(settings)
+    for issue in issues:
+        print(f"Settings issue: {issue}")
+
+    if issues:
+        return 1
+
+    if validate_only:
+        print("Settings are valid.")
+        return 0
+
+    # NHS Workforce Statistics Pipeline
+    if settings["pipeline_nwfs"]:
+        from utils.nhs_wf_stats import nhs_wf_stats
 
-from utils.nhs_wf_stats import *
-from utils.pwr_trends import *
+        print("\nExecuting NHS Workforce Statistics Pipeline.")
+        nhs_wf_stats(settings=settings)
 
-# Load runtime settings
-settings = load_runtime_settings()
+    # PWR Pipeline
+    if settings["pipeline_pwr"]:
+        from utils.pwr_trends import pwr_trends
 
-# NHS Workforce Statistics Pipeline
-if settings["pipeline_nwfs"]:
-    print("\nExecuting NHS Workforce Statistics Pipeline.")
-    nhs_wf_stats(settings=settings)
+        print("\nExecuting PWR Pipeline.")
+        pwr_trends(settings=settings)
 
-# NHS Workforce Statistics Pipeline
-if settings["pipeline_pwr"]:
-    print("\nExecuting PWR Pipeline.")
-    pwr_trends(settings=settings)
+    print("\nFinished executing pipelines.\n")
 
-print("\nFinished executing pipelines.\n")
+    return 0
 
+if __name__ == "__main__":
+    sys.exit(main())